@@ -1,6 +1,8 @@
 from rag.spec_rag import answer
+from retrieval.retrieve import warmup
 
 if __name__ == "__main__":
+    warmup()
     while True:
         q = input("\nAsk a WCAG question (or 'quit'): ").strip()
         if q.lower() in ("quit", "exit"):
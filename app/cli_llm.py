@@ -1,6 +1,8 @@
 from rag.llm_rag import answer_with_llm
+from retrieval.retrieve import warmup
 
 if __name__ == "__main__":
+    warmup()
     while True:
         q = input("\nAsk a WCAG question (or 'quit'): ").strip()
         if q.lower() in ("quit", "exit"):
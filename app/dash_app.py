@@ -1,18 +1,50 @@
 import os
+import secrets
+import threading
+import time
 
 import dash
 from dash import html, dcc, Input, Output, State
+from flask import Response, request, stream_with_context
 
-from rag.llm_rag import answer_with_llm
+from rag.llm_rag import prepare_answer, stream_prepared_answer
+from retrieval.retrieve import CHROMA_HOST, warmup
 
 PERSIST_DIR = os.path.join("data", "vectorstore", "chroma_wcag22")
+LLM_MODEL = "gpt-4o-mini"
+TOPK_MIN, TOPK_MAX = 3, 10
 
+# prepare_answer() output from on_search, waiting for the browser's /stream request.
+# token -> (expires_at, question, k, out); each token is consumed once.
+STREAM_TTL = 120  # seconds
+_pending = {}
+_pending_lock = threading.Lock()
 
-def result_card(i, meta, dist, doc):
+
+def _stash(question, k, out):
+    token = secrets.token_urlsafe(16)
+    now = time.monotonic()
+    with _pending_lock:
+        for t in [t for t, item in _pending.items() if item[0] < now]:
+            del _pending[t]
+        _pending[token] = (now + STREAM_TTL, question, k, out)
+    return token
+
+
+def _take(token):
+    with _pending_lock:
+        item = _pending.pop(token, None)
+    if item is None or item[0] < time.monotonic():
+        return None
+    return item[1:]
+
+
+def result_card(i, meta, dist, snippet, truncated):
     title = f"{meta.get('sc_id')} — {meta.get('sc_title')}"
     level = meta.get("level") or "Unknown"
     url = meta.get("url") or ""
-    snippet = doc[:1200] + ("…" if len(doc) > 1200 else "")
+    if truncated:
+        snippet = snippet + "…"
 
     return html.Details(
         open=(i == 0),
@@ -98,11 +130,11 @@ app.layout = html.Div(
                         html.Label("Top-k"),
                         dcc.Slider(
                             id="topk",
-                            min=3,
-                            max=10,
+                            min=TOPK_MIN,
+                            max=TOPK_MAX,
                             step=1,
                             value=5,
-                            marks={i: str(i) for i in range(3, 11)},
+                            marks={i: str(i) for i in range(TOPK_MIN, TOPK_MAX + 1)},
                             tooltip={"placement": "bottom", "always_visible": False},
                         ),
                     ],
@@ -123,23 +155,24 @@ app.layout = html.Div(
         html.Div(id="status", style={"marginTop": "14px"}),
         html.Hr(style={"margin": "18px 0"}),
         html.H3("Answer"),
-        dcc.Loading(
-            type="default",
-            children=html.Div(
-                id="answer_box",
-                style={
-                    "whiteSpace": "pre-wrap",
-                    "background": "white",
-                    "border": "1px solid #e5e5e5",
-                    "borderRadius": "12px",
-                    "padding": "14px",
-                },
-            ),
+        # Filled in the browser from the /stream event source, not by Dash callbacks
+        html.Div(
+            id="answer_box",
+            style={
+                "whiteSpace": "pre-wrap",
+                "background": "white",
+                "border": "1px solid #e5e5e5",
+                "borderRadius": "12px",
+                "padding": "14px",
+            },
         ),
+        dcc.Store(id="stream_token"),
+        dcc.Store(id="stream_started"),
         html.H3("Citations"),
         html.Div(id="citations_box"),
         html.Hr(style={"margin": "18px 0"}),
         html.H3("Retrieved chunks (debug)"),
+        dcc.Store(id="results_store"),
         html.Div(id="results"),
     ],
 )
@@ -147,42 +180,45 @@ app.layout = html.Div(
 
 @app.callback(
     Output("status", "children"),
-    Output("answer_box", "children"),
     Output("citations_box", "children"),
-    Output("results", "children"),
+    Output("results_store", "data"),
+    Output("stream_token", "data"),
     Input("search_btn", "n_clicks"),
     State("query", "value"),
     State("topk", "value"),
 )
 def on_search(n_clicks, query, topk):
     if not n_clicks:
-        return html.Div("Enter a question and click Ask."), "", "", []
+        return html.Div("Enter a question and click Ask."), "", [], None
 
     if not query or not query.strip():
         msg = html.Div("Please enter a question.", style={"color": "crimson"})
-        return msg, "", "", []
+        return msg, "", [], None
 
-    if not os.path.exists(PERSIST_DIR):
+    if not CHROMA_HOST and not os.path.exists(PERSIST_DIR):
         msg = html.Div(
-            f"Vector index not found at {PERSIST_DIR}. Run: python retrieval/build_index.py",
+            f"Vector index not found at {PERSIST_DIR}. Run: python -m retrieval.build_index",
             style={"color": "crimson"},
         )
-        return msg, "", "", []
+        return msg, "", [], None
+
+    question = query.strip()
+    k = min(max(int(topk or 5), TOPK_MIN), TOPK_MAX)
 
+    # Retrieval runs once, here; /stream generates from this same output
     try:
-        out = answer_with_llm(query.strip(), k=int(topk), model="gpt-4o-mini")
+        out = prepare_answer(question, k=k, model=LLM_MODEL)
     except Exception as e:
         msg = html.Div(f"RAG call failed: {e}", style={"color": "crimson"})
-        return msg, "", "", []
+        return msg, "", [], None
 
     refused = out.get("refused", False)
     status = html.Div(
         "Refused (low-confidence retrieval). Try rephrasing."
         if refused
-        else "Answered from retrieved WCAG 2.2 sources."
+        else "Answering from retrieved WCAG 2.2 sources (streamed below)."
     )
 
-    answer_text = out.get("answer", "")
     citations = out.get("citations", []) or []
     results = out.get("results", []) or []
 
@@ -208,12 +244,82 @@ def on_search(n_clicks, query, topk):
     else:
         citations_box = html.Div("(No citations)")
 
-    cards = []
-    for i, r in enumerate(results):
-        cards.append(result_card(i, r["meta"], r["distance"], r["text"]))
+    # Full chunk text isn't rendered, so keep it out of the browser-side store
+    stored = [
+        {"meta": r.meta, "distance": r.distance, "snippet": r.snippet, "truncated": r.truncated}
+        for r in results
+    ]
+
+    return status, citations_box, stored, _stash(question, k, out)
+
+
+def _sse(data, event=None):
+    """One Server-Sent Event; multi-line data is split across data: fields."""
+    head = f"event: {event}\n" if event else ""
+    return head + "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
 
-    return status, answer_text, citations_box, cards
+
+@app.server.route("/stream")
+def stream():
+    pending = _take(request.args.get("id") or "")
+    if pending is None:
+        return Response("Unknown or expired stream id", status=404)
+    question, k, out = pending
+
+    def events():
+        try:
+            for delta in stream_prepared_answer(question, out, k=k, model=LLM_MODEL):
+                yield _sse(delta)
+        except Exception as e:
+            yield _sse(f"RAG call failed: {e}", event="failed")
+        yield _sse("", event="done")
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+app.clientside_callback(
+    """
+    function(token) {
+        const box = document.getElementById("answer_box");
+        if (window.wcagStream) {
+            window.wcagStream.close();
+            window.wcagStream = null;
+        }
+        box.textContent = "";
+        if (!token) {
+            return window.dash_clientside.no_update;
+        }
+        const params = new URLSearchParams({id: token});
+        const source = new EventSource("/stream?" + params.toString());
+        window.wcagStream = source;
+        source.onmessage = (e) => { box.textContent += e.data; };
+        source.addEventListener("failed", (e) => { box.textContent = e.data; });
+        source.addEventListener("done", () => source.close());
+        source.onerror = () => source.close();
+        return token;
+    }
+    """,
+    Output("stream_started", "data"),
+    Input("stream_token", "data"),
+)
+
+
+@app.callback(
+    Output("results", "children"),
+    Input("results_store", "data"),
+)
+def render_results(results):
+    return [
+        result_card(i, r["meta"], r["distance"], r["snippet"], r["truncated"])
+        for i, r in enumerate(results or [])
+    ]
 
 
 if __name__ == "__main__":
+    if CHROMA_HOST or os.path.exists(PERSIST_DIR):
+        warmup()
     app.run(debug=True)
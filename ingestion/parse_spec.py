@@ -1,7 +1,8 @@
-import json
 import os
 import re
-from typing import Optional, Tuple, List
+from typing import Iterator, Optional, Tuple
+
+import orjson
 from bs4 import BeautifulSoup, Tag
 
 print("=== parse_spec.py is running ===")
@@ -17,6 +18,9 @@ SC_ANYWHERE_RE = re.compile(r"\b(\d+\.\d+\.\d+)\b")
 
 LEVEL_RE = re.compile(r"\bLevel\s+(A{1,3})\b", re.IGNORECASE)
 
+SC_TAGS = {"h2", "h3", "h4", "h5", "dt"}
+TEXT_TAGS = {"p", "li", "dt", "dd", "blockquote"}
+
 def normalize_text(text: str) -> str:
     text = re.sub(r"[ \t]+", " ", text)
     text = re.sub(r"\n{3,}", "\n\n", text)
@@ -40,7 +44,7 @@ def parse_sc_from_text(txt: str) -> Optional[Tuple[str, str]]:
 
 def is_sc_node(tag: Tag) -> Optional[Tuple[str, str]]:
     # SCs might appear in headings or <dt> terms
-    if tag.name in ("h2", "h3", "h4", "h5", "dt"):
+    if tag.name in SC_TAGS:
         txt = tag.get_text(" ", strip=True)
         return parse_sc_from_text(txt)
     return None
@@ -49,30 +53,48 @@ def is_major_section_heading(tag: Tag) -> bool:
     """True if this tag is a top-level section heading (used to stop the last SC from eating later sections)."""
     return tag.name == "h2"
 
-def collect_until_next_sc(start_node: Tag) -> str:
-    parts: List[str] = []
-
-    # include the title line
-    parts.append(start_node.get_text(" ", strip=True))
+def iter_sc_sections(soup: BeautifulSoup) -> Iterator[Tuple[Tag, str, str, Optional[str], str]]:
+    """
+    Single document-order pass yielding (tag, sc_id, sc_title, level, text) per distinct SC.
+    A section runs until the next SC node (duplicates included) or the next h2.
+    """
+    seen = set()
+    current = None  # [tag, sc_id, sc_title, level, parts]
 
-    for el in start_node.next_elements:
-        if isinstance(el, Tag):
-            if el is not start_node and is_sc_node(el):
-                break
-            if el is not start_node and is_major_section_heading(el):
-                break
+    for el in soup.descendants:
+        if not isinstance(el, Tag):
+            continue
+        # SC/h2 boundaries always matter; body text only inside a section
+        is_heading = el.name in SC_TAGS
+        if not is_heading and not (current and el.name in TEXT_TAGS):
+            continue
 
-            # skip nav-like sections
-            if el.name in ("nav", "header", "footer"):
-                continue
+        # One get_text per tag: serves SC detection, the title line and body text
+        txt = el.get_text(" ", strip=True)
+        parsed = parse_sc_from_text(txt) if is_heading else None
+        if parsed or is_major_section_heading(el):
+            if current:
+                tag, sc_id, sc_title, level, parts = current
+                yield tag, sc_id, sc_title, level, normalize_text("\n".join(parts))
+            current = None
+
+            # Deduplicate by sc_id, keeping the first occurrence
+            if parsed and parsed[0] not in seen:
+                seen.add(parsed[0])
+                # include the title line
+                current = [el, parsed[0], parsed[1], infer_level(txt), [txt]]
+            continue
 
-            # collect readable text blocks
-            if el.name in ("p", "li", "dt", "dd", "blockquote"):
-                txt = el.get_text(" ", strip=True)
-                if txt:
-                    parts.append(txt)
+        # collect readable text blocks
+        if current and el.name in TEXT_TAGS and txt:
+            current[4].append(txt)
+            # "(Level AA)" sits right under the heading; stop searching once found
+            if current[3] is None:
+                current[3] = infer_level(txt)
 
-    return normalize_text("\n".join(parts))
+    if current:
+        tag, sc_id, sc_title, level, parts = current
+        yield tag, sc_id, sc_title, level, normalize_text("\n".join(parts))
 
 def infer_level(text: str) -> Optional[str]:
     m = LEVEL_RE.search(text)
@@ -98,33 +120,10 @@ def main() -> None:
     os.makedirs(os.path.dirname(OUT_PATH), exist_ok=True)
 
     with open(RAW_SPEC_PATH, "rb") as f:
-        soup = BeautifulSoup(f.read(), "html.parser")
-
-    # Collect SC nodes in document order
-    sc_nodes: List[Tuple[Tag, str, str]] = []
-    for tag in soup.find_all(["h2", "h3", "h4", "h5", "dt"]):
-        parsed = is_sc_node(tag)
-        if parsed:
-            sc_nodes.append((tag, parsed[0], parsed[1]))
-
-    # Deduplicate by sc_id while preserving order
-    seen = set()
-    ordered = []
-    for tag, sc_id, sc_title in sc_nodes:
-        if sc_id in seen:
-            continue
-        seen.add(sc_id)
-        ordered.append((tag, sc_id, sc_title))
-
-    print(f"[INFO] SC nodes found (deduped): {len(ordered)}")
-    print("[INFO] First 10 SCs:")
-    for _, sc_id, sc_title in ordered[:10]:
-        print(f"  - {sc_id} {sc_title}")
+        soup = BeautifulSoup(f.read(), "lxml")
 
     chunks = []
-    for tag, sc_id, sc_title in ordered:
-        text = collect_until_next_sc(tag)
-        level = infer_level(text)
+    for tag, sc_id, sc_title, level, text in iter_sc_sections(soup):
         anchor_id = anchor_for(tag)
         url = f"https://www.w3.org/TR/WCAG22/#{anchor_id}" if anchor_id else "https://www.w3.org/TR/WCAG22/"
 
@@ -140,9 +139,14 @@ def main() -> None:
             "text": text
         })
 
-    with open(OUT_PATH, "w", encoding="utf-8") as out:
+    print(f"[INFO] SC nodes found (deduped): {len(chunks)}")
+    print("[INFO] First 10 SCs:")
+    for c in chunks[:10]:
+        print(f"  - {c['sc_id']} {c['sc_title']}")
+
+    with open(OUT_PATH, "wb") as out:
         for c in chunks:
-            out.write(json.dumps(c, ensure_ascii=False) + "\n")
+            out.write(orjson.dumps(c, option=orjson.OPT_APPEND_NEWLINE))
 
     print(f"[INFO] Wrote {len(chunks)} chunks -> {OUT_PATH}")
 
@@ -1,38 +1,156 @@
+import hashlib
+import json
 import os
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
+import numpy as np
+from diskcache import Cache
 from openai import OpenAI
-from retrieval.retrieve import retrieve
+from retrieval.embeddings import encode
+from retrieval.retrieve import Result, get_client, retrieve
 
 # You can swap this later (gpt-4o-mini is fast/cheap; gpt-5.2 is stronger)
 DEFAULT_MODEL = "gpt-4o-mini"
 
-def _format_context(results: List[Dict[str, Any]]) -> str:
+# Semantic answer cache: near-duplicate questions reuse a stored answer
+QCACHE_COLLECTION = "wcag22_qcache"
+QCACHE_MAX_DISTANCE = 0.08  # cosine distance between question embeddings
+
+# Exact-repeat memo: same normalized question, k and model within the TTL
+LLM_CACHE_DIR = os.path.join("data", "cache", "llm")
+LLM_CACHE_TTL = 24 * 60 * 60  # seconds
+
+# Identical on every call so it forms a stable, cacheable prompt prefix
+SYSTEM_INSTRUCTIONS = (
+    "You are a WCAG 2.2 compliance assistant.\n"
+    "You will be given WCAG 2.2 Sources followed by a Question.\n"
+    "You MUST answer using only the provided Sources.\n"
+    "If the Sources do not contain the answer, say you don’t have enough information.\n"
+    "When you make a claim, cite it using the source labels like [S1], [S2].\n"
+    "Do not cite anything outside the provided Sources.\n"
+)
+
+# Retrieved results surfaced as citations
+N_CITATIONS = 3
+
+def _format_context(results: List[Result]) -> Tuple[str, List[Dict[str, str]]]:
     """
-    Build a context block for the LLM with explicit source IDs for citation.
+    Build a context block for the LLM with explicit source IDs for citation,
+    plus the clean citation list (top N_CITATIONS), in a single pass over results.
     """
     blocks = []
+    citations = []
     for i, r in enumerate(results, start=1):
-        m = r["meta"]
+        m = r.meta
         sc_id = m.get("sc_id", "")
         title = m.get("sc_title", "")
         level = m.get("level", "")
         url = m.get("url", "")
-        text = r["text"]
+        text = r.text
 
         blocks.append(
             f"[S{i}] {sc_id} — {title} (Level {level})\nURL: {url}\n\n{text}\n"
         )
-    return "\n---\n".join(blocks)
+        if i <= N_CITATIONS:
+            citations.append({
+                "sc_id": sc_id,
+                "sc_title": title,
+                "level": level,
+                "url": url,
+            })
+    return "\n---\n".join(blocks), citations
 
-def _should_refuse(results: List[Dict[str, Any]]) -> bool:
+def _should_refuse(results: List[Result]) -> bool:
     if not results:
         return True
     # Same heuristic as before; tune as you test
-    return results[0]["distance"] > 0.55
+    return results[0].distance > 0.55
 
-def answer_with_llm(question: str, k: int = 5, model: str = DEFAULT_MODEL) -> Dict[str, Any]:
-    results = retrieve(question, k=k)
+@lru_cache(maxsize=1)
+def _qcache():
+    return get_client().get_or_create_collection(
+        name=QCACHE_COLLECTION,
+        metadata={"hnsw:space": "cosine"}
+    )
+
+def _qcache_lookup(q_emb: np.ndarray, k: int, model: str) -> Optional[Dict[str, Any]]:
+    col = _qcache()
+    if col.count() == 0:
+        return None
+    res = col.query(
+        query_embeddings=q_emb.reshape(1, -1),
+        n_results=1,
+        where={"$and": [{"model": model}, {"k": k}]},
+        include=["metadatas", "distances"],
+    )
+    if not res["ids"][0] or res["distances"][0][0] >= QCACHE_MAX_DISTANCE:
+        return None
+    return res["metadatas"][0][0]
+
+def _qcache_store(
+    question: str,
+    q_emb: np.ndarray,
+    k: int,
+    model: str,
+    answer_text: str,
+    citations: List[Dict[str, str]],
+) -> None:
+    key = hashlib.sha1(f"{model}|{k}|{question}".encode("utf-8")).hexdigest()
+    _qcache().upsert(
+        ids=[key],
+        embeddings=q_emb.reshape(1, -1),
+        metadatas=[{
+            "query": question,
+            "answer": answer_text,
+            "citations_json": json.dumps(citations, ensure_ascii=False),
+            "model": model,
+            "k": k,
+        }],
+    )
+
+@lru_cache(maxsize=1)
+def _answer_cache() -> Cache:
+    return Cache(LLM_CACHE_DIR)
+
+def _answer_key(question: str, k: int, model: str) -> str:
+    return hashlib.sha1(f"{model}|{k}|{question.lower().strip()}".encode("utf-8")).hexdigest()
+
+def _llm_request(question: str, context: str, model: str) -> Dict[str, Any]:
+    """Keyword arguments shared by responses.create and responses.stream."""
+    # Sources before the question: provider prompt caching matches on prefixes,
+    # so follow-ups over the same retrieved context reuse the cached tokens.
+    user_prompt = (
+        f"Sources:\n{context}\n\n"
+        "---\n"
+        f"Question: {question}\n\n"
+        "Write a concise answer. Then include a 'Citations' section listing the cited sources "
+        "with SC id + title + URL."
+    )
+    return {
+        "model": model,
+        "input": [
+            {"role": "system", "content": SYSTEM_INSTRUCTIONS},
+            {"role": "user", "content": user_prompt},
+        ],
+        "extra_body": {
+            "prompt_cache_key": hashlib.sha1(context.encode("utf-8")).hexdigest()
+        },
+    }
+
+def prepare_answer(question: str, k: int = 5, model: str = DEFAULT_MODEL) -> Dict[str, Any]:
+    """
+    Everything short of the LLM call: answer memo, retrieval, refusal check, semantic
+    cache lookup. "answer" is None when the LLM still has to run; "context" and
+    "q_emb" are then set.
+    """
+    key = _answer_key(question, k, model)
+    memo = _answer_cache().get(key)
+    if memo is not None:
+        return {**memo, "cached": True}
+
+    q_emb = encode([question])[0]
+    results = retrieve(question, k=k, q_emb=q_emb)
 
     if _should_refuse(results):
         return {
@@ -45,51 +163,79 @@ def answer_with_llm(question: str, k: int = 5, model: str = DEFAULT_MODEL) -> Di
             "results": results,
         }
 
-    context = _format_context(results)
+    cached = _qcache_lookup(q_emb, k, model)
+    if cached:
+        out = {
+            "answer": cached["answer"],
+            "citations": json.loads(cached["citations_json"]),
+            "refused": False,
+            "results": results,
+            "model": model,
+            "cached": True,
+        }
+        _answer_cache().set(key, out, expire=LLM_CACHE_TTL)
+        return out
 
-    system_instructions = (
-        "You are a WCAG 2.2 compliance assistant.\n"
-        "You MUST answer using only the provided Sources.\n"
-        "If the Sources do not contain the answer, say you don’t have enough information.\n"
-        "When you make a claim, cite it using the source labels like [S1], [S2].\n"
-        "Do not cite anything outside the provided Sources.\n"
-    )
+    context, citations = _format_context(results)
+    return {
+        "answer": None,
+        "citations": citations,
+        "refused": False,
+        "results": results,
+        "model": model,
+        "cached": False,
+        "context": context,
+        "q_emb": q_emb,
+    }
 
-    user_prompt = (
-        f"Question: {question}\n\n"
-        f"Sources:\n{context}\n\n"
-        "Write a concise answer. Then include a 'Citations' section listing the cited sources "
-        "with SC id + title + URL."
-    )
+def answer_with_llm(question: str, k: int = 5, model: str = DEFAULT_MODEL) -> Dict[str, Any]:
+    out = prepare_answer(question, k=k, model=model)
+    if out["answer"] is not None:
+        return out
+
+    context = out.pop("context")
+    q_emb = out.pop("q_emb")
 
     client = OpenAI()  # uses OPENAI_API_KEY from environment :contentReference[oaicite:2]{index=2}
 
     # Responses API (recommended for new projects) :contentReference[oaicite:3]{index=3}
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": system_instructions},
-            {"role": "user", "content": user_prompt},
-        ],
-    )
+    resp = client.responses.create(**_llm_request(question, context, model))
+    out["answer"] = resp.output_text
 
-    answer_text = resp.output_text
+    _qcache_store(question, q_emb, k, model, out["answer"], out["citations"])
+    _answer_cache().set(_answer_key(question, k, model), out, expire=LLM_CACHE_TTL)
+    return out
 
-    # Build a clean citation list from retrieved metadata (top 3 by default)
-    citations = []
-    for r in results[:3]:
-        m = r["meta"]
-        citations.append({
-            "sc_id": m.get("sc_id", ""),
-            "sc_title": m.get("sc_title", ""),
-            "level": m.get("level", ""),
-            "url": m.get("url", ""),
-        })
+def stream_answer_with_llm(question: str, k: int = 5, model: str = DEFAULT_MODEL) -> Iterator[str]:
+    """
+    Yield the answer text as the LLM generates it.
+    Refusals and cache hits come back as a single chunk.
+    """
+    out = prepare_answer(question, k=k, model=model)
+    yield from stream_prepared_answer(question, out, k=k, model=model)
 
-    return {
-        "answer": answer_text,
-        "citations": citations,
-        "refused": False,
-        "results": results,
-        "model": model,
-    }
+def stream_prepared_answer(
+    question: str, out: Dict[str, Any], k: int = 5, model: str = DEFAULT_MODEL
+) -> Iterator[str]:
+    """
+    Stream the answer for an out dict already returned by prepare_answer(),
+    so callers that showed its citations don't retrieve a second time.
+    """
+    if out["answer"] is not None:
+        yield out["answer"]
+        return
+
+    context = out.pop("context")
+    q_emb = out.pop("q_emb")
+
+    client = OpenAI()
+    parts = []
+    with client.responses.stream(**_llm_request(question, context, model)) as stream:
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                parts.append(event.delta)
+                yield event.delta
+
+    out["answer"] = "".join(parts)
+    _qcache_store(question, q_emb, k, model, out["answer"], out["citations"])
+    _answer_cache().set(_answer_key(question, k, model), out, expire=LLM_CACHE_TTL)
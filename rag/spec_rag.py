@@ -1,5 +1,5 @@
 from typing import Dict, Any, List
-from retrieval.retrieve import retrieve
+from retrieval.retrieve import Result, retrieve
 
 def citation(meta: Dict[str, Any]) -> Dict[str, str]:
     return {
@@ -9,23 +9,22 @@ def citation(meta: Dict[str, Any]) -> Dict[str, str]:
         "url": meta.get("url", ""),
     }
 
-def should_refuse(results: List[Dict[str, Any]]) -> bool:
+def should_refuse(results: List[Result]) -> bool:
     # cosine distance: lower = more similar
     if not results:
         return True
-    best = results[0]["distance"]
+    best = results[0].distance
     # Start with this; tune after you see behavior
     return best > 0.40
 
-def build_answer_from_top_result(question: str, top: Dict[str, Any]) -> str:
-    meta = top["meta"]
+def build_answer_from_top_result(question: str, top: Result) -> str:
+    meta = top.meta
     sc_id = meta.get("sc_id", "Unknown")
     title = meta.get("sc_title", "")
     level = meta.get("level", "Unknown")
 
     # Keep it grounded: we *quote/excerpt* rather than freestyle.
-    text = top["text"]
-    excerpt = text[:1200] + ("…" if len(text) > 1200 else "")
+    excerpt = top.snippet + ("…" if top.truncated else "")
 
     return (
         f"Based on the WCAG 2.2 normative text I retrieved, the most relevant requirement is:\n"
@@ -50,7 +49,7 @@ def answer(question: str, k: int = 5) -> Dict[str, Any]:
     top = results[0]
     return {
         "answer": build_answer_from_top_result(question, top),
-        "citations": [citation(r["meta"]) for r in results[:3]],
+        "citations": [citation(r.meta) for r in results[:3]],
         "refused": False,
         "results": results,
     }
@@ -1,24 +1,23 @@
-import json
 import os
 from typing import List, Dict
 
-import chromadb
-from sentence_transformers import SentenceTransformer
+import orjson
+from diskcache import Cache
+
+from retrieval import vector_store
+from retrieval.embeddings import EMBED_BACKEND, M2V_DIR, distill_static_model, encode_documents
+from retrieval.retrieve import CHROMA_HOST, get_client
 
 INPUT_PATH = os.path.join("data", "processed", "wcag22_spec_sc.jsonl")
 PERSIST_DIR = os.path.join("data", "vectorstore", "chroma_wcag22")
 COLLECTION_NAME = "wcag22_spec"
-
-EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+QCACHE_COLLECTION = "wcag22_qcache"
+LLM_CACHE_DIR = os.path.join("data", "cache", "llm")
 
 def load_jsonl(path: str) -> List[Dict]:
-    docs = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                docs.append(json.loads(line))
-    return docs
+    # orjson decodes bytes directly and tolerates the trailing newline
+    with open(path, "rb") as f:
+        return [orjson.loads(line) for line in f if not line.isspace()]
 
 def main():
     if not os.path.exists(INPUT_PATH):
@@ -31,15 +30,23 @@ def main():
     docs = load_jsonl(INPUT_PATH)
     print(f"[INFO] Loaded {len(docs)} chunks")
 
-    model = SentenceTransformer(EMBED_MODEL_NAME)
+    # Same encoder as retrieve.py so query/doc embeddings share one space
+    if EMBED_BACKEND == "model2vec" and not os.path.isdir(M2V_DIR):
+        print(f"[INFO] Distilling static model -> {M2V_DIR}")
+        distill_static_model()
 
-    client = chromadb.PersistentClient(path=PERSIST_DIR)
+    # Writes through the Chroma server when CHROMA_HOST is set
+    client = get_client()
 
-    # Reset collection during development
-    try:
-        client.delete_collection(COLLECTION_NAME)
-    except Exception:
-        pass
+    # Reset collection during development; cached answers cite the old index
+    for name in (COLLECTION_NAME, QCACHE_COLLECTION):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    if os.path.isdir(LLM_CACHE_DIR):
+        with Cache(LLM_CACHE_DIR) as memo:
+            memo.clear()
 
     collection = client.create_collection(
         name=COLLECTION_NAME,
@@ -47,11 +54,7 @@ def main():
     )
 
     texts = [d["text"] for d in docs]
-    embeddings = model.encode(
-        texts,
-        show_progress_bar=True,
-        normalize_embeddings=True
-    )
+    embeddings = encode_documents(texts, show_progress_bar=True)
 
     ids = [d["sc_id"] for d in docs]
     def safe_str(x):
@@ -72,12 +75,18 @@ def main():
     collection.add(
         ids=ids,
         documents=texts,
-        embeddings=embeddings.tolist(),
+        embeddings=embeddings,
         metadatas=metadatas
     )
 
+    if vector_store.INDEX_BACKEND != "chroma":
+        vector_store.save_index(ids, embeddings)
+        print(
+            f"[INFO] {vector_store.INDEX_BACKEND} index written to {vector_store.INDEX_DIR}"
+        )
+
     print(
-        f"[INFO] Index built at {PERSIST_DIR} "
+        f"[INFO] Index built at {CHROMA_HOST or PERSIST_DIR} "
         f"(collection='{COLLECTION_NAME}', items={collection.count()})"
     )
 
@@ -0,0 +1,112 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "model2vec" = static distillation of the model (token lookup + mean pool, no torch),
+# "onnx" = dynamic-quantized INT8 export (AVX512-VNNI int8 matmuls on CPU),
+# "torch" = original FP32 PyTorch runtime.
+# The index must be built with the same backend that serves queries.
+EMBED_BACKEND = os.environ.get("WCAG_EMBED_BACKEND", "model2vec")
+
+# Shipped in the all-MiniLM-L6-v2 model repo, so no local export step is needed
+ONNX_FILE_NAME = "onnx/model_qint8_avx512_vnni.onnx"
+
+M2V_DIR = os.path.join("data", "m2v")
+M2V_PCA_DIMS = 256
+
+# Index-time batch size for the transformer backends
+DOC_BATCH_SIZE = 128
+# Fan out over a process pool only when the corpus outweighs loading one model per worker
+MULTI_PROCESS_MIN_DOCS = 10_000
+
+_model = None
+
+def distill_static_model(out_dir: str = M2V_DIR) -> None:
+    """One-time Model2Vec distillation of EMBED_MODEL_NAME (needs torch, build time only)."""
+    from model2vec.distill import distill
+
+    m = distill(model_name=EMBED_MODEL_NAME, pca_dims=M2V_PCA_DIMS)
+    m.save_pretrained(out_dir)
+
+def get_model():
+    global _model
+    if _model is None:
+        if EMBED_BACKEND == "model2vec":
+            from model2vec import StaticModel
+
+            if not os.path.isdir(M2V_DIR):
+                raise FileNotFoundError(
+                    f"Missing {M2V_DIR}. Run python -m retrieval.build_index first."
+                )
+            _model = StaticModel.from_pretrained(M2V_DIR, normalize=True)
+        elif EMBED_BACKEND == "onnx":
+            from sentence_transformers import SentenceTransformer
+
+            _model = SentenceTransformer(
+                EMBED_MODEL_NAME,
+                backend="onnx",
+                model_kwargs={"file_name": ONNX_FILE_NAME},
+            )
+        else:
+            from sentence_transformers import SentenceTransformer
+
+            _model = SentenceTransformer(EMBED_MODEL_NAME)
+    return _model
+
+def encode(texts: List[str], **kwargs) -> np.ndarray:
+    """L2-normalized embeddings (one row per text) from the configured backend."""
+    model = get_model()
+    if EMBED_BACKEND == "model2vec":
+        # normalization is baked into the StaticModel at load time
+        return model.encode(texts, **kwargs)
+    return model.encode(texts, normalize_embeddings=True, **kwargs)
+
+def encode_documents(texts: List[str], **kwargs) -> np.ndarray:
+    """Index-time encoding: bigger batches, fp16 on CUDA; always returns float32."""
+    if EMBED_BACKEND == "model2vec":
+        return encode(texts, **kwargs).astype(np.float32, copy=False)
+
+    model = get_model()
+    if EMBED_BACKEND == "torch" and model.device.type == "cuda":
+        # build_index is its own process, so halving the shared model is safe here
+        model.half()
+    devices = None
+    if EMBED_BACKEND == "torch" and len(texts) >= MULTI_PROCESS_MIN_DOCS:
+        devices = _pool_devices()
+    if devices:
+        embeddings = _encode_multi_process(model, texts, devices, **kwargs)
+    else:
+        # SentenceTransformer.encode already length-sorts texts before batching
+        embeddings = encode(texts, batch_size=DOC_BATCH_SIZE, convert_to_numpy=True, **kwargs)
+    return embeddings.astype(np.float32, copy=False)
+
+def _pool_devices() -> Optional[List[str]]:
+    """
+    One worker per GPU on multi-GPU boxes, fp32 CPU workers (half the cores) when
+    there is no GPU, None for a single GPU, where one fp16 process is the fast path.
+    """
+    import torch
+
+    n_gpus = torch.cuda.device_count()
+    if n_gpus > 1:
+        return [f"cuda:{i}" for i in range(n_gpus)]
+    if n_gpus == 0:
+        return ["cpu"] * max(1, (os.cpu_count() or 2) // 2)
+    return None
+
+def _encode_multi_process(model, texts: List[str], devices: List[str], **kwargs) -> np.ndarray:
+    """Shard encoding over a SentenceTransformers process pool on the given devices."""
+    pool = model.start_multi_process_pool(target_devices=devices)
+    try:
+        return model.encode_multi_process(
+            texts,
+            pool,
+            batch_size=DOC_BATCH_SIZE,
+            normalize_embeddings=True,
+            **kwargs,
+        )
+    finally:
+        model.stop_multi_process_pool(pool)
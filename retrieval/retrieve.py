@@ -1,39 +1,60 @@
 import os
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, NamedTuple, Optional
 import chromadb
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+from retrieval import vector_store
+from retrieval.embeddings import encode, get_model
 
 PERSIST_DIR = os.path.join("data", "vectorstore", "chroma_wcag22")
 COLLECTION_NAME = "wcag22_spec"
-EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-
-_model = None
-
-def get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(EMBED_MODEL_NAME)
-    return _model
-
-def retrieve(query: str, k: int = 5) -> List[Dict[str, Any]]:
-    client = chromadb.PersistentClient(path=PERSIST_DIR)
-    col = client.get_collection(COLLECTION_NAME)
-
-    model = get_model()
-    q_emb = model.encode([query], normalize_embeddings=True)[0].tolist()
-
-    res = col.query(
-        query_embeddings=[q_emb],
-        n_results=k,
-        include=["documents", "metadatas", "distances"],
-    )
-
-    results = []
-    for i in range(len(res["ids"][0])):
-        results.append({
-            "id": res["ids"][0][i],
-            "distance": res["distances"][0][i],
-            "text": res["documents"][0][i],
-            "meta": res["metadatas"][0][i],
-        })
-    return results
+
+# Set to use a separate Chroma server, e.g.
+#   chroma run --path data/vectorstore/chroma_wcag22 --port 8000
+# so the HNSW index lives outside the web process.
+CHROMA_HOST = os.environ.get("CHROMA_HOST")
+CHROMA_PORT = int(os.environ.get("CHROMA_PORT", "8000"))
+
+# Display excerpt length, cut once here instead of on every render
+SNIPPET_CHARS = 1200
+
+class Result(NamedTuple):
+    id: str
+    distance: float
+    text: str
+    meta: Dict[str, Any]
+    snippet: str
+    truncated: bool
+
+@lru_cache(maxsize=1)
+def get_client():
+    if CHROMA_HOST:
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    return chromadb.PersistentClient(path=PERSIST_DIR)
+
+@lru_cache(maxsize=1)
+def _col():
+    return get_client().get_collection(COLLECTION_NAME)
+
+def warmup() -> None:
+    """Load the encoder and open the collection up front so the first query doesn't pay for it."""
+    get_model()
+    _col()
+    if vector_store.INDEX_BACKEND != "chroma":
+        vector_store.load_index()
+
+def retrieve(query: str, k: int = 5, q_emb: Optional[np.ndarray] = None) -> List[Result]:
+    col = _col()
+
+    if q_emb is None:
+        q_emb = encode([query])[0]
+
+    res = vector_store.query(col, np.asarray(q_emb, dtype=np.float32), k)
+
+    return [
+        Result(id_, dist, text, meta, text[:SNIPPET_CHARS], len(text) > SNIPPET_CHARS)
+        for id_, dist, text, meta in zip(
+            res["ids"][0], res["distances"][0], res["documents"][0], res["metadatas"][0]
+        )
+    ]
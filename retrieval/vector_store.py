@@ -0,0 +1,181 @@
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+INDEX_DIR = os.path.join("data", "vectorstore", "wcag22_quantized")
+
+# "binary" = 1-bit sign codes scanned by Hamming distance, with the best
+#            candidates rescored by float32 cosine (Binary Passage Retrieval);
+# "int8"   = per-vector scalar-quantized codes scored with int32-accumulated dot products;
+# "ivfpq"  = FAISS IVF-PQ (inverted lists + product-quantized codes), for corpora
+#            well beyond the spec's ~80 SCs;
+# "chroma" = Chroma's own float32 HNSW.
+# Chroma stores documents + metadata either way.
+INDEX_BACKEND = os.environ.get("WCAG_INDEX_BACKEND", "binary")
+
+# Binary candidates kept per requested result for float32 rescoring
+RESCORE_MULTIPLIER = 10
+
+# IVF-PQ shape; clamped in _build_ivfpq so small corpora can still be trained
+IVF_NLIST = 64
+IVF_NPROBE = 8
+PQ_M = 48
+PQ_NBITS = 8
+
+# Set bits per byte value, for Hamming distance over packed codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def quantize_binary(embeddings: np.ndarray) -> np.ndarray:
+    """Pack the sign of each dimension into bits (384 dims -> 48 bytes per vector)."""
+    return np.packbits(embeddings > 0, axis=-1)
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 codes with one float32 scale per vector (384 dims -> 388 bytes)."""
+    scales = np.abs(embeddings).max(axis=-1, keepdims=True) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.round(embeddings / scales).astype(np.int8)
+    return codes, scales.squeeze(-1)
+
+def _build_ivfpq(embeddings: np.ndarray):
+    import faiss
+
+    x = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, d = x.shape
+    # k-means wants ~39 points per IVF centroid and at least 2**nbits points per PQ codebook
+    nlist = max(1, min(IVF_NLIST, n // 39))
+    nbits = max(1, min(PQ_NBITS, int(np.log2(n))))
+    m = max(i for i in range(1, PQ_M + 1) if d % i == 0)
+
+    quantizer = faiss.IndexFlatIP(d)
+    index = faiss.IndexIVFPQ(quantizer, d, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+    index.train(x)
+    index.add(x)
+    return index
+
+def save_index(
+    ids: List[str],
+    embeddings: np.ndarray,
+    index_dir: str = INDEX_DIR,
+    backend: str = INDEX_BACKEND,
+) -> None:
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+
+    if backend == "binary":
+        np.save(os.path.join(index_dir, "binary.npy"), quantize_binary(embeddings))
+        np.save(os.path.join(index_dir, "float32.npy"), embeddings.astype(np.float32, copy=False))
+    elif backend == "int8":
+        codes, scales = quantize_int8(embeddings)
+        np.save(os.path.join(index_dir, "int8.npy"), codes)
+        np.save(os.path.join(index_dir, "scales.npy"), scales)
+    elif backend == "ivfpq":
+        import faiss
+
+        faiss.write_index(_build_ivfpq(embeddings), os.path.join(index_dir, "ivfpq.faiss"))
+    else:
+        raise ValueError(f"Unknown index backend: {backend}")
+
+@lru_cache(maxsize=1)
+def load_index(
+    index_dir: str = INDEX_DIR,
+    backend: str = INDEX_BACKEND,
+) -> Tuple[List[str], Dict[str, Any]]:
+    ids_path = os.path.join(index_dir, "ids.json")
+    if not os.path.exists(ids_path):
+        raise FileNotFoundError(
+            f"Missing {ids_path}. Run python -m retrieval.build_index first."
+        )
+    with open(ids_path, "r", encoding="utf-8") as f:
+        ids = json.load(f)
+
+    if backend == "binary":
+        arrays = {
+            "binary": np.load(os.path.join(index_dir, "binary.npy")),
+            # float32 rows are only read for rescoring candidates, so leave them on disk
+            "float32": np.load(os.path.join(index_dir, "float32.npy"), mmap_mode="r"),
+        }
+    elif backend == "int8":
+        arrays = {
+            "int8": np.load(os.path.join(index_dir, "int8.npy")),
+            "scales": np.load(os.path.join(index_dir, "scales.npy")),
+        }
+    elif backend == "ivfpq":
+        import faiss
+
+        index = faiss.read_index(os.path.join(index_dir, "ivfpq.faiss"))
+        index.nprobe = min(IVF_NPROBE, index.nlist)
+        arrays = {"index": index}
+    else:
+        raise ValueError(f"Unknown index backend: {backend}")
+    return ids, arrays
+
+def search_binary(q_emb: np.ndarray, k: int) -> Tuple[List[str], List[float]]:
+    """Hamming scan over packed codes, then exact cosine over the top k * RESCORE_MULTIPLIER."""
+    ids, arrays = load_index()
+    codes, floats = arrays["binary"], arrays["float32"]
+    n_cand = min(len(ids), k * RESCORE_MULTIPLIER)
+    if n_cand <= 0:
+        return [], []
+
+    hamming = _POPCOUNT[np.bitwise_xor(codes, quantize_binary(q_emb))].sum(axis=1, dtype=np.int32)
+    cand = np.sort(np.argpartition(hamming, n_cand - 1)[:n_cand])
+
+    scores = floats[cand] @ q_emb
+    top = np.argsort(-scores)[:k]
+    # cosine distance, same scale as Chroma's "cosine" space
+    return [ids[i] for i in cand[top]], (1.0 - scores[top]).tolist()
+
+def search_int8(q_emb: np.ndarray, k: int) -> Tuple[List[str], List[float]]:
+    """Exact scan over int8 codes; cosine ~= scale_d * scale_q * (codes_d . codes_q)."""
+    ids, arrays = load_index()
+    n = min(len(ids), k)
+    if n <= 0:
+        return [], []
+
+    q_codes, q_scale = quantize_int8(q_emb)
+    dots = np.matmul(arrays["int8"], q_codes, dtype=np.int32)
+    scores = dots * arrays["scales"] * q_scale
+
+    top = np.argpartition(-scores, n - 1)[:n]
+    top = top[np.argsort(-scores[top])]
+    return [ids[i] for i in top], (1.0 - scores[top]).tolist()
+
+def search_ivfpq(q_emb: np.ndarray, k: int) -> Tuple[List[str], List[float]]:
+    """Approximate inner-product search over the nprobe closest inverted lists."""
+    ids, arrays = load_index()
+    if k <= 0:
+        return [], []
+
+    scores, rows = arrays["index"].search(q_emb.reshape(1, -1).astype(np.float32), k)
+    # faiss pads with -1 when fewer than k vectors are reachable
+    hits = [(ids[i], 1.0 - float(sc)) for i, sc in zip(rows[0], scores[0]) if i >= 0]
+    return [h[0] for h in hits], [h[1] for h in hits]
+
+_SEARCH = {
+    "binary": search_binary,
+    "int8": search_int8,
+    "ivfpq": search_ivfpq,
+}
+
+def query(col, q_emb: np.ndarray, k: int) -> Dict[str, Any]:
+    """Top-k hits in the columnar shape returned by Chroma's col.query()."""
+    if INDEX_BACKEND == "chroma":
+        return col.query(
+            query_embeddings=q_emb.reshape(1, -1),
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+        )
+
+    hit_ids, distances = _SEARCH[INDEX_BACKEND](q_emb, k)
+    got = col.get(ids=hit_ids, include=["documents", "metadatas"])
+    pos = {id_: i for i, id_ in enumerate(got["ids"])}
+    return {
+        "ids": [hit_ids],
+        "distances": [distances],
+        "documents": [[got["documents"][pos[i]] for i in hit_ids]],
+        "metadatas": [[got["metadatas"][pos[i]] for i in hit_ids]],
+    }